@@ -28,7 +28,7 @@ def upgrade() -> None:
     sa.Column('battery_level', sa.Integer(), nullable=False),
     sa.Column('rssi', sa.Integer(), nullable=False),
     sa.Column('online', sa.Boolean(), nullable=False),
-    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
     sa.PrimaryKeyConstraint('id')
     )
     op.create_index(op.f('ix_device_status_device_id'), 'device_status', ['device_id'], unique=False)
@@ -2,9 +2,12 @@ from operator import or_
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from app.core.database import SessionLocal
+from app.core.engine import record_checkout_wait
 from app.models.database import DeviceStatus
 from app.models.schemas import DeviceStatusCreate, DeviceStatusResponse, HistoricalStatusResponse
-from app.core.security import get_api_key
+from app.services.device_status import latest_status, latest_status_per_device
+from app.core import rate_limit
+from app.core.rate_limit import limit_ingest, limit_read
 from typing import Optional, Generator
 from math import ceil
 from datetime import datetime, timedelta, timezone
@@ -14,9 +17,11 @@ router = APIRouter()
 def get_db() -> Generator[Session, None, None]:
     """
     Dependency that provides a SQLAlchemy session and ensures it is closed after use.
+    Checks out the connection up front so pool wait time can drive load shedding.
     """
     db = SessionLocal()
     try:
+        record_checkout_wait(db, rate_limit.pool_wait_tracker.record)
         yield db
     finally:
         db.close()
@@ -24,12 +29,12 @@ def get_db() -> Generator[Session, None, None]:
 @router.post("/status", response_model=DeviceStatusResponse, status_code=201)
 def create_status(
     payload: DeviceStatusCreate,
-    db: Session = Depends(get_db),
-    api_key: str = Depends(get_api_key)
+    api_key: str = Depends(limit_ingest),
+    db: Session = Depends(get_db)
 ) -> DeviceStatusResponse:
     """
     Create a new status update for a device.
-    Requires a valid API key.
+    Requires a valid API key and is subject to rate limiting.
     """
     status_obj = DeviceStatus(**payload.model_dump())
     db.add(status_obj)
@@ -41,26 +46,16 @@ def create_status(
 
 @router.get("/status/summary")
 def get_status_summary(
-    db: Session = Depends(get_db),
-    api_key: str = Depends(get_api_key)
+    api_key: str = Depends(limit_read),
+    db: Session = Depends(get_db)
 ) -> dict:
     """
     Get a summary of all devices, including their latest status.
     Returns total, online, and offline device counts.
-    Requires a valid API key.
+    Requires a valid API key and is subject to rate limiting.
     """
     # Get the latest status for each device
-    subq = (
-        db.query(
-            DeviceStatus.device_id,
-            DeviceStatus.battery_level,
-            DeviceStatus.online,
-            DeviceStatus.timestamp
-        )
-        .distinct(DeviceStatus.device_id)
-        .order_by(DeviceStatus.device_id, DeviceStatus.timestamp.desc())
-        .all()
-    )
+    latest_statuses = latest_status_per_device(db)
     devices = [
         {
             "device_id": row.device_id,
@@ -68,7 +63,7 @@ def get_status_summary(
             "online": row.online,
             "last_update": row.timestamp
         }
-        for row in subq
+        for row in latest_statuses
     ]
     return {
         "devices": devices,
@@ -79,19 +74,14 @@ def get_status_summary(
 
 @router.get("/status/at-risk")
 def get_at_risk_devices(
-    db: Session = Depends(get_db),
-    api_key: str = Depends(get_api_key)
+    api_key: str = Depends(limit_read),
+    db: Session = Depends(get_db)
 ) -> dict:
     
     thirty_mins_ago = datetime.now(timezone.utc) - timedelta(minutes=30)
 
     # Get the latest status for each device
-    latest_statuses = (
-        db.query(DeviceStatus)
-        .distinct(DeviceStatus.device_id)
-        .order_by(DeviceStatus.device_id, DeviceStatus.timestamp.desc())
-        .all()
-    )
+    latest_statuses = latest_status_per_device(db)
     
     # Filter for at-risk devices
     risk_devices = [
@@ -113,20 +103,15 @@ def get_at_risk_devices(
 @router.get("/status/{device_id}", response_model=DeviceStatusResponse)
 def get_latest_status(
     device_id: str,
-    db: Session = Depends(get_db),
-    api_key: str = Depends(get_api_key)
+    api_key: str = Depends(limit_read),
+    db: Session = Depends(get_db)
 ) -> DeviceStatusResponse:
     """
     Get the latest status update for a specific device.
     Returns 404 if the device is not found.
-    Requires a valid API key.
+    Requires a valid API key and is subject to rate limiting.
     """
-    status_obj = (
-        db.query(DeviceStatus)
-        .filter(DeviceStatus.device_id == device_id)
-        .order_by(DeviceStatus.timestamp.desc())
-        .first()
-    )
+    status_obj = latest_status(db, device_id)
     if not status_obj:
         raise HTTPException(status_code=404, detail="Device not found")
     return status_obj
@@ -136,13 +121,13 @@ def get_historical_status(
     device_id: str,
     page: int = Query(1, ge=1, description="Page number"),
     page_size: int = Query(10, ge=1, le=100, description="Number of records per page"),
-    db: Session = Depends(get_db),
-    api_key: str = Depends(get_api_key)
+    api_key: str = Depends(limit_read),
+    db: Session = Depends(get_db)
 ) -> dict:
     """
     Get a paginated list of all status updates for a device.
     Returns 404 if the device is not found.
-    Requires a valid API key.
+    Requires a valid API key and is subject to rate limiting.
     """
     # Check if device exists
     device_exists = db.query(DeviceStatus).filter(DeviceStatus.device_id == device_id).first()
@@ -200,19 +185,14 @@ Increase in the number of devices in our database
 
 @router.get("/status/at-risk")
 def get_at_risk_devices(
-    db: Session = Depends(get_db),
-    api_key: str = Depends(get_api_key)
+    api_key: str = Depends(limit_read),
+    db: Session = Depends(get_db)
 ) -> dict:
     
     thirty_mins_ago = datetime.now(timezone.utc) - timedelta(minutes=30)
 
     # Get the latest status for each device
-    latest_statuses = (
-        db.query(DeviceStatus)
-        .distinct(DeviceStatus.device_id)
-        .order_by(DeviceStatus.device_id, DeviceStatus.timestamp.desc())
-        .all()
-    )
+    latest_statuses = latest_status_per_device(db)
     
     # Filter for at-risk devices
     risk_devices = [
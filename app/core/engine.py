@@ -0,0 +1,88 @@
+"""
+Engine construction and pool instrumentation.
+Kept free of import-time side effects so tools such as the benchmark can
+build engines for any backend without touching DATABASE_URL.
+"""
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+import time
+from typing import Callable
+
+# Pragmas applied to every SQLite connection (edge gateways / fast tests).
+# WAL lets readers proceed while a heartbeat is being written; NORMAL sync is
+# durable across app crashes and only risks the last commits on power loss.
+SQLITE_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,   # ms to wait on a locked database instead of failing
+    "cache_size": -20000,   # ~20 MB page cache
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+
+def is_sqlite_memory(url: str) -> bool:
+    """
+    True for in-memory SQLite URLs (``sqlite://`` or ``sqlite:///:memory:``).
+    """
+    return url in ("sqlite://", "sqlite:///:memory:")
+
+def _track_connect_time(engine: Engine) -> None:
+    """
+    Record how long opening each new DBAPI connection takes on its pool record,
+    so record_checkout_wait() can tell pool waiting apart from connection setup.
+    """
+    @event.listens_for(engine, "do_connect")
+    def _connect_started(dialect, connection_record, cargs, cparams):
+        connection_record.info["connect_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "connect")
+    def _connect_finished(dbapi_connection, connection_record):
+        started = connection_record.info.pop("connect_started", None)
+        if started is not None:
+            connection_record.info["connect_seconds"] = time.perf_counter() - started
+
+def record_checkout_wait(db: Session, record: Callable[[float], None]) -> None:
+    """
+    Check out ``db``'s connection and pass the time spent waiting on the pool, in ms, to ``record``.
+    Time spent opening a brand-new connection is excluded. A checkout that times out
+    on an exhausted pool is still recorded before the error is re-raised.
+    """
+    started = time.perf_counter()
+    try:
+        connection = db.connection()
+    except PoolTimeoutError:
+        record((time.perf_counter() - started) * 1000)
+        raise
+    elapsed = time.perf_counter() - started
+    record(max(0.0, elapsed - connection.info.pop("connect_seconds", 0.0)) * 1000)
+
+def build_engine(url: str) -> Engine:
+    """
+    Create an engine for ``url``, tuning SQLite connections when needed.
+    In-memory SQLite uses a single shared connection so every session sees the same data.
+    """
+    if not url.startswith("sqlite"):
+        engine = create_engine(url)
+        _track_connect_time(engine)
+        return engine
+
+    memory = is_sqlite_memory(url)
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool if memory else None,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not memory:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    _track_connect_time(engine)
+    return engine
@@ -0,0 +1,304 @@
+"""
+Per-API-key and per-device rate limiting with adaptive load shedding.
+
+Every request draws from two token buckets: one for the calling API key and
+one for the device it touches. Ingest (POST /status) and read endpoints use
+separate budgets, so a burst of dashboard reads cannot block heartbeats and
+vice versa. Buckets live in process memory by default; set
+``RATE_LIMIT_REDIS_URL`` to share them between replicas.
+
+When the average wait for a DB pool connection climbs, the service sheds
+load: reads are rejected first, and ingest only once the wait is worse still.
+"""
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from math import ceil
+from typing import Any, Callable, List, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request, status
+
+from app.core.security import get_api_key
+from app.models.schemas import DeviceStatusCreate
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+
+# Shed reads once the average pool wait exceeds this many milliseconds,
+# and ingest once it exceeds the (higher) ingest threshold.
+SHED_READ_WAIT_MS = float(os.getenv("SHED_READ_WAIT_MS", "250"))
+SHED_INGEST_WAIT_MS = float(os.getenv("SHED_INGEST_WAIT_MS", "1000"))
+
+
+@dataclass(frozen=True)
+class BucketConfig:
+    """
+    Token bucket budget: refills at ``rate`` tokens per second up to ``burst``.
+    """
+    rate: float
+    burst: int
+
+
+def _bucket_from_env(prefix: str, rate: str, burst: str) -> BucketConfig:
+    config = BucketConfig(
+        rate=float(os.getenv(f"{prefix}_RATE", rate)),
+        burst=int(os.getenv(f"{prefix}_BURST", burst)),
+    )
+    if config.rate <= 0:
+        raise ValueError(f"{prefix}_RATE must be greater than 0, got {config.rate}")
+    if config.burst < 1:
+        raise ValueError(f"{prefix}_BURST must be at least 1, got {config.burst}")
+    return config
+
+
+INGEST_KEY_LIMIT = _bucket_from_env("RATE_LIMIT_INGEST_KEY", "100", "200")
+INGEST_DEVICE_LIMIT = _bucket_from_env("RATE_LIMIT_INGEST_DEVICE", "5", "20")
+READ_KEY_LIMIT = _bucket_from_env("RATE_LIMIT_READ_KEY", "50", "100")
+READ_DEVICE_LIMIT = _bucket_from_env("RATE_LIMIT_READ_DEVICE", "10", "40")
+
+
+class MemoryBucketStore:
+    """
+    Thread-safe in-process token bucket store.
+    ``take_many`` checks every bucket before taking from any, so a request
+    rejected by one bucket never spends tokens from the others.
+    Each bucket remembers when it will be full again. Once the store doubles in
+    size since the last prune, full buckets are dropped in one batch, so a
+    stream of one-off device IDs cannot grow it forever and pruning stays
+    amortized O(1) per request.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic, max_buckets: int = 10000):
+        self._clock = clock
+        self._max_buckets = max_buckets
+        self._prune_at = 2 * max_buckets
+        # key -> (tokens, last update, time at which the bucket is full again)
+        self._buckets: dict[str, tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, key: str, limit: BucketConfig) -> float:
+        """
+        Try to take one token from ``key``'s bucket.
+        Returns 0 if the request is allowed, otherwise the seconds until a token is available.
+        """
+        return self.take_many([(key, limit)])[0]
+
+    def take_many(self, buckets: List[Tuple[str, BucketConfig]]) -> List[float]:
+        """
+        Take one token from each bucket only if every bucket has one.
+        Returns the seconds until each bucket has a token (all 0 if the request is allowed).
+        """
+        with self._lock:
+            now = self._clock()
+            levels = []
+            for key, limit in buckets:
+                tokens, updated, _ = self._buckets.get(key, (float(limit.burst), now, now))
+                levels.append(min(float(limit.burst), tokens + (now - updated) * limit.rate))
+            waits = [max(0.0, (1 - tokens) / limit.rate) for tokens, (_, limit) in zip(levels, buckets)]
+            allowed = not any(waits)
+            for tokens, (key, limit) in zip(levels, buckets):
+                if allowed:
+                    tokens -= 1
+                self._buckets[key] = (tokens, now, now + (limit.burst - tokens) / limit.rate)
+            if len(self._buckets) >= self._prune_at:
+                self._prune(now)
+            return waits
+
+    def _prune(self, now: float) -> None:
+        self._buckets = {
+            key: bucket
+            for key, bucket in self._buckets.items()
+            if bucket[2] > now
+        }
+        # Buckets still refilling are kept; wait for the store to double again
+        # before the next pass so a large active set doesn't prune every request.
+        self._prune_at = max(2 * self._max_buckets, 2 * len(self._buckets))
+
+
+class RedisBucketStore:
+    """
+    Token bucket store shared between replicas through Redis.
+    All buckets for a request are checked and taken in a single Lua script,
+    so the step is atomic and tokens are only spent when every bucket allows it.
+    If Redis is unreachable, limits fall back to a local ``MemoryBucketStore``
+    and Redis is not retried for ``retry_after`` seconds, so an outage adds no
+    per-request latency.
+    """
+
+    # KEYS are bucket keys; ARGV holds a (rate, burst) pair per key.
+    SCRIPT = """
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    local levels, waits = {}, {}
+    local allowed = true
+    for i = 1, #KEYS do
+        local rate = tonumber(ARGV[2 * i - 1])
+        local burst = tonumber(ARGV[2 * i])
+        local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'updated')
+        local tokens = tonumber(bucket[1]) or burst
+        local updated = tonumber(bucket[2]) or now
+        levels[i] = math.min(burst, tokens + (now - updated) * rate)
+        waits[i] = '0'
+        if levels[i] < 1 then
+            waits[i] = tostring((1 - levels[i]) / rate)
+            allowed = false
+        end
+    end
+    for i = 1, #KEYS do
+        local rate = tonumber(ARGV[2 * i - 1])
+        local burst = tonumber(ARGV[2 * i])
+        local tokens = levels[i]
+        if allowed then
+            tokens = tokens - 1
+        end
+        redis.call('HSET', KEYS[i], 'tokens', tokens, 'updated', now)
+        redis.call('EXPIRE', KEYS[i], math.ceil(burst / rate) + 1)
+    end
+    return waits
+    """
+
+    def __init__(self, script: Callable[..., Any], errors: tuple[type[Exception], ...],
+                 retry_after: float = 5.0, clock: Callable[[], float] = time.monotonic):
+        self._script = script
+        self._errors = errors
+        self._retry_after = retry_after
+        self._clock = clock
+        self._fallback = MemoryBucketStore()
+        self._degraded = False
+        self._retry_at = 0.0
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBucketStore":
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError("RATE_LIMIT_REDIS_URL is set but the 'redis' package is not installed") from exc
+        client = redis.Redis.from_url(url, socket_timeout=0.1, socket_connect_timeout=0.1)
+        return cls(client.register_script(cls.SCRIPT), (redis.RedisError,))
+
+    def take(self, key: str, limit: BucketConfig) -> float:
+        return self.take_many([(key, limit)])[0]
+
+    def take_many(self, buckets: List[Tuple[str, BucketConfig]]) -> List[float]:
+        if self._degraded and self._clock() < self._retry_at:
+            return self._fallback.take_many(buckets)
+        args = []
+        for _, limit in buckets:
+            args += [limit.rate, limit.burst]
+        try:
+            waits = self._script(keys=[f"ratelimit:{key}" for key, _ in buckets], args=args)
+        except self._errors:
+            if not self._degraded:
+                logger.warning("Redis rate limit store unavailable, using in-memory buckets", exc_info=True)
+                self._degraded = True
+            self._retry_at = self._clock() + self._retry_after
+            return self._fallback.take_many(buckets)
+        if self._degraded:
+            logger.info("Redis rate limit store recovered")
+            self._degraded = False
+        return [float(wait) for wait in waits]
+
+
+class PoolWaitTracker:
+    """
+    Exponentially weighted average of how long requests wait for a DB connection.
+    The average only counts once ``min_samples`` samples have arrived since it
+    last went stale, so a single slow checkout can't trigger shedding. Samples
+    older than ``stale_after`` seconds are ignored, so a fully shed endpoint
+    recovers once the pool stops reporting pressure.
+    """
+
+    def __init__(self, alpha: float = 0.2, stale_after: float = 5.0, min_samples: int = 5,
+                 clock: Callable[[], float] = time.monotonic):
+        self._alpha = alpha
+        self._stale_after = stale_after
+        self._min_samples = min_samples
+        self._clock = clock
+        self._avg_ms = 0.0
+        self._samples = 0
+        self._updated: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _is_stale(self) -> bool:
+        return self._updated is None or self._clock() - self._updated > self._stale_after
+
+    def record(self, wait_ms: float) -> None:
+        with self._lock:
+            if self._is_stale():
+                self._avg_ms = wait_ms
+                self._samples = 1
+            else:
+                self._avg_ms += self._alpha * (wait_ms - self._avg_ms)
+                self._samples += 1
+            self._updated = self._clock()
+
+    @property
+    def average_ms(self) -> float:
+        with self._lock:
+            if self._is_stale() or self._samples < self._min_samples:
+                return 0.0
+            return self._avg_ms
+
+
+bucket_store = RedisBucketStore.from_url(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else MemoryBucketStore()
+pool_wait_tracker = PoolWaitTracker()
+
+
+def _too_many_requests(retry_after: float, message: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail={"error": "Too Many Requests", "message": message},
+        headers={"Retry-After": str(max(1, ceil(retry_after)))},
+    )
+
+
+def _shed_if_overloaded(threshold_ms: float) -> None:
+    if pool_wait_tracker.average_ms > threshold_ms:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"error": "Service Unavailable", "message": "Server is overloaded, retry later"},
+            headers={"Retry-After": "1"},
+        )
+
+
+def _enforce(api_key: str, device_id: Optional[str], scope: str,
+             key_limit: BucketConfig, device_limit: BucketConfig) -> None:
+    buckets = [(f"{scope}:key:{api_key}", key_limit)]
+    if device_id is not None:
+        buckets.append((f"{scope}:device:{device_id}", device_limit))
+    # Check both buckets together so a device over its own budget doesn't
+    # also drain the shared key budget for every other device on that key
+    waits = bucket_store.take_many(buckets)
+    if device_id is not None and waits[1]:
+        raise _too_many_requests(waits[1], f"Rate limit exceeded for device {device_id}")
+    if waits[0]:
+        raise _too_many_requests(waits[0], "Rate limit exceeded for API key")
+
+
+def limit_ingest(payload: DeviceStatusCreate, api_key: str = Depends(get_api_key)) -> str:
+    """
+    Dependency that authenticates and rate limits status ingestion.
+    Raises 503 when shedding ingest load and 429 when the key or device is over budget.
+    """
+    if RATE_LIMIT_ENABLED:
+        _shed_if_overloaded(SHED_INGEST_WAIT_MS)
+        _enforce(api_key, payload.device_id, "ingest", INGEST_KEY_LIMIT, INGEST_DEVICE_LIMIT)
+    return api_key
+
+
+def limit_read(request: Request, api_key: str = Depends(get_api_key)) -> str:
+    """
+    Dependency that authenticates and rate limits read endpoints.
+    Raises 503 when shedding read load and 429 when the key or device is over budget.
+    """
+    if RATE_LIMIT_ENABLED:
+        _shed_if_overloaded(SHED_READ_WAIT_MS)
+        _enforce(api_key, request.path_params.get("device_id"), "read", READ_KEY_LIMIT, READ_DEVICE_LIMIT)
+    return api_key
@@ -1,8 +1,34 @@
+from datetime import timezone
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, func
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.types import TypeDecorator
 
 Base = declarative_base()
 
+class UTCDateTime(TypeDecorator):
+    """
+    Timezone-aware DateTime that behaves the same on every backend.
+    Values are stored in UTC; naive values are assumed to already be UTC.
+    SQLite has no timezone support, so results are re-tagged as UTC on load.
+    """
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return value
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        value = value.astimezone(timezone.utc)
+        if dialect.name == "sqlite":
+            value = value.replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
+
 class DeviceStatus(Base):
     """
     SQLAlchemy model for storing IoT device status updates.
@@ -12,8 +38,8 @@ class DeviceStatus(Base):
 
     id = Column(Integer, primary_key=True, index=True)  # Unique status record ID
     device_id = Column(String(255), nullable=False, index=True)  # Device identifier
-    timestamp = Column(DateTime(timezone=True), nullable=False)  # When the status was recorded
+    timestamp = Column(UTCDateTime, nullable=False)  # When the status was recorded
     battery_level = Column(Integer, nullable=False)  # Battery percentage (0-100)
     rssi = Column(Integer, nullable=False)  # Signal strength
     online = Column(Boolean, nullable=False)  # Device online status
-    created_at = Column(DateTime(timezone=True), server_default=func.now())  # Record creation time
\ No newline at end of file
+    created_at = Column(UTCDateTime, server_default=func.now())  # Record creation time
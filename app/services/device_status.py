@@ -0,0 +1,51 @@
+"""
+Backend-portable queries over device status history.
+Endpoints call these instead of using dialect-specific SQL directly, so the
+service runs unchanged on PostgreSQL and on SQLite.
+"""
+from typing import List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.models.database import DeviceStatus
+
+def latest_status(db: Session, device_id: str) -> Optional[DeviceStatus]:
+    """
+    Return the most recent status row for ``device_id``, or None if it has never reported.
+    """
+    return (
+        db.query(DeviceStatus)
+        .filter(DeviceStatus.device_id == device_id)
+        .order_by(DeviceStatus.timestamp.desc())
+        .first()
+    )
+
+def latest_status_per_device(db: Session) -> List[DeviceStatus]:
+    """
+    Return the most recent status row for every device, ordered by device_id.
+    Uses DISTINCT ON where PostgreSQL is available and a ROW_NUMBER() window elsewhere.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return (
+            db.query(DeviceStatus)
+            .distinct(DeviceStatus.device_id)
+            .order_by(DeviceStatus.device_id, DeviceStatus.timestamp.desc())
+            .all()
+        )
+
+    ranked = (
+        db.query(
+            DeviceStatus.id.label("id"),
+            func.row_number().over(
+                partition_by=DeviceStatus.device_id,
+                order_by=(DeviceStatus.timestamp.desc(), DeviceStatus.id.desc())
+            ).label("rank")
+        )
+        .subquery()
+    )
+    return (
+        db.query(DeviceStatus)
+        .join(ranked, DeviceStatus.id == ranked.c.id)
+        .filter(ranked.c.rank == 1)
+        .order_by(DeviceStatus.device_id)
+        .all()
+    )
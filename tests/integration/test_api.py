@@ -1,30 +1,42 @@
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
-from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
-from app.core.database import DATABASE_URL
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+from app.core import rate_limit
+from app.core.database import engine
+from app.models.database import Base, DeviceStatus
 import os
 
 client = TestClient(app)
 headers = {"X-API-Key": "supersecretkey123"}
 
-@pytest.fixture(autouse=True)
-def cleanup_database():
-    # Create a new connection
-    engine = create_engine(DATABASE_URL)
-    
-    # Clean up before each test
+def clear_device_status():
     with engine.connect() as connection:
-        connection.execute(text("TRUNCATE TABLE device_status RESTART IDENTITY"))
+        if engine.dialect.name == "postgresql":
+            connection.execute(text("TRUNCATE TABLE device_status RESTART IDENTITY"))
+        else:
+            connection.execute(DeviceStatus.__table__.delete())
         connection.commit()
+
+@pytest.fixture(autouse=True)
+def cleanup_database(monkeypatch):
+    # Give every test fresh rate limit buckets and pool wait history
+    monkeypatch.setattr(rate_limit, "bucket_store", rate_limit.MemoryBucketStore())
+    monkeypatch.setattr(rate_limit, "pool_wait_tracker", rate_limit.PoolWaitTracker())
+
+    # SQLite (e.g. DATABASE_URL=sqlite:// for an in-memory run) has no
+    # migrations applied, so create the schema directly
+    if engine.dialect.name == "sqlite":
+        Base.metadata.create_all(engine)
+
+    # Clean up before each test
+    clear_device_status()
     
     yield  # This allows the test to run
     
     # Clean up after each test (optional, but good practice)
-    with engine.connect() as connection:
-        connection.execute(text("TRUNCATE TABLE device_status RESTART IDENTITY"))
-        connection.commit()
+    clear_device_status()
 
 def test_create_and_summary():
     payload = {
@@ -145,4 +157,91 @@ def test_missing_api_key():
         "online": True
     }
     response = client.post("/status", json=payload)  # No header
-    assert response.status_code == 401
\ No newline at end of file
+    assert response.status_code == 401
+
+def test_summary_uses_latest_status_per_device():
+    for ts, online in [("2025-06-09T14:00:00Z", True), ("2025-06-09T15:00:00Z", False)]:
+        payload = {
+            "device_id": "sensor-latest",
+            "timestamp": ts,
+            "battery_level": 50,
+            "rssi": -50,
+            "online": online
+        }
+        client.post("/status", json=payload, headers=headers)
+    response = client.get("/status/summary", headers=headers)
+    data = response.json()
+    assert data["total_devices"] == 1
+    assert data["devices"][0]["online"] is False
+    assert data["offline_devices"] == 1
+
+def test_at_risk_devices():
+    payload = {
+        "device_id": "sensor-low-battery",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "battery_level": 10,
+        "rssi": -50,
+        "online": True
+    }
+    client.post("/status", json=payload, headers=headers)
+    payload.update(device_id="sensor-healthy", battery_level=90)
+    client.post("/status", json=payload, headers=headers)
+    response = client.get("/status/at-risk", headers=headers)
+    assert response.status_code == 200
+    ids = [d["device_id"] for d in response.json()["risk_devices"]]
+    assert ids == ["sensor-low-battery"]
+
+def test_ingest_rate_limited_per_device(monkeypatch):
+    monkeypatch.setattr(rate_limit, "INGEST_DEVICE_LIMIT", rate_limit.BucketConfig(rate=0.5, burst=2))
+    payload = {
+        "device_id": "sensor-chatty",
+        "timestamp": "2025-06-14T10:00:00Z",
+        "battery_level": 90,
+        "rssi": -40,
+        "online": True
+    }
+    for _ in range(2):
+        assert client.post("/status", json=payload, headers=headers).status_code == 201
+    response = client.post("/status", json=payload, headers=headers)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+
+    # Other devices on the same key still have budget
+    payload["device_id"] = "sensor-quiet"
+    assert client.post("/status", json=payload, headers=headers).status_code == 201
+
+def test_reads_shed_before_ingest_under_pool_pressure(monkeypatch):
+    tracker = rate_limit.PoolWaitTracker(min_samples=1)
+    tracker.record((rate_limit.SHED_READ_WAIT_MS + rate_limit.SHED_INGEST_WAIT_MS) / 2)
+    monkeypatch.setattr(rate_limit, "pool_wait_tracker", tracker)
+
+    response = client.get("/status/summary", headers=headers)
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+    payload = {
+        "device_id": "sensor-under-load",
+        "timestamp": "2025-06-14T10:00:00Z",
+        "battery_level": 90,
+        "rssi": -40,
+        "online": True
+    }
+    assert client.post("/status", json=payload, headers=headers).status_code == 201
+
+def test_chatty_device_does_not_drain_key_budget(monkeypatch):
+    monkeypatch.setattr(rate_limit, "INGEST_KEY_LIMIT", rate_limit.BucketConfig(rate=0.01, burst=10))
+    monkeypatch.setattr(rate_limit, "INGEST_DEVICE_LIMIT", rate_limit.BucketConfig(rate=0.01, burst=3))
+    payload = {
+        "device_id": "sensor-noisy",
+        "timestamp": "2025-06-14T10:00:00Z",
+        "battery_level": 90,
+        "rssi": -40,
+        "online": True
+    }
+    codes = [client.post("/status", json=payload, headers=headers).status_code for _ in range(15)]
+    assert codes.count(201) == 3
+    assert codes.count(429) == 12
+
+    # Rejected requests spent none of the key's tokens, so a quiet device still gets through
+    payload["device_id"] = "sensor-quiet"
+    assert client.post("/status", json=payload, headers=headers).status_code == 201
@@ -0,0 +1,15 @@
+import pytest
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from app.core.engine import record_checkout_wait
+
+
+class ExhaustedPoolSession:
+    def connection(self):
+        raise PoolTimeoutError("QueuePool limit reached")
+
+
+def test_checkout_timeout_is_still_recorded():
+    samples = []
+    with pytest.raises(PoolTimeoutError):
+        record_checkout_wait(ExhaustedPoolSession(), samples.append)
+    assert len(samples) == 1
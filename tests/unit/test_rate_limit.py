@@ -0,0 +1,197 @@
+import pytest
+from fastapi import HTTPException
+from app.core import rate_limit
+from app.core.rate_limit import BucketConfig, MemoryBucketStore, PoolWaitTracker, RedisBucketStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_bucket_allows_burst_then_rejects():
+    clock = FakeClock()
+    store = MemoryBucketStore(clock=clock)
+    limit = BucketConfig(rate=2, burst=3)
+    for _ in range(3):
+        assert store.take("key", limit) == 0
+    # Bucket is empty; the next token arrives after 1 / rate seconds
+    assert store.take("key", limit) == pytest.approx(0.5)
+
+
+def test_bucket_refills_over_time():
+    clock = FakeClock()
+    store = MemoryBucketStore(clock=clock)
+    limit = BucketConfig(rate=1, burst=1)
+    assert store.take("key", limit) == 0
+    assert store.take("key", limit) > 0
+    clock.now += 1
+    assert store.take("key", limit) == 0
+
+
+def test_buckets_are_independent():
+    store = MemoryBucketStore(clock=FakeClock())
+    limit = BucketConfig(rate=1, burst=1)
+    assert store.take("device-a", limit) == 0
+    assert store.take("device-a", limit) > 0
+    assert store.take("device-b", limit) == 0
+
+
+def test_idle_buckets_are_pruned():
+    clock = FakeClock()
+    store = MemoryBucketStore(clock=clock, max_buckets=2)
+    limit = BucketConfig(rate=1, burst=1)
+    store.take("a", limit)
+    store.take("b", limit)
+    clock.now += 10
+    store.take("c", limit)
+    store.take("d", limit)
+    # "a" and "b" refilled long ago, so the prune at 2 * max_buckets drops them
+    assert len(store) == 2
+
+
+def test_prune_uses_each_buckets_own_refill_time():
+    clock = FakeClock()
+    store = MemoryBucketStore(clock=clock, max_buckets=2)
+    slow = BucketConfig(rate=1, burst=20)
+    fast = BucketConfig(rate=100, burst=200)
+    for _ in range(20):
+        store.take("ingest:device:sensor-1", slow)
+    clock.now += 5
+    # A prune triggered from a fast-refilling scope must not reset the slow bucket
+    for key in ("ingest:key:a", "ingest:key:b", "ingest:key:c"):
+        store.take(key, fast)
+    for _ in range(5):
+        assert store.take("ingest:device:sensor-1", slow) == 0
+    assert store.take("ingest:device:sensor-1", slow) > 0
+
+
+def test_active_buckets_do_not_prune_on_every_take():
+    clock = FakeClock()
+    store = MemoryBucketStore(clock=clock, max_buckets=2)
+    limit = BucketConfig(rate=1, burst=10)
+    for key in "abcd":
+        store.take(key, limit)
+    # The first prune kept all four active buckets; once they have refilled,
+    # the store still waits until it doubles again before pruning
+    clock.now += 100
+    for key in "efg":
+        store.take(key, limit)
+    assert len(store) == 7
+    store.take("h", limit)
+    assert len(store) == 4
+
+
+def test_take_many_spends_nothing_when_any_bucket_rejects():
+    store = MemoryBucketStore(clock=FakeClock())
+    key_limit = BucketConfig(rate=1, burst=3)
+    device_limit = BucketConfig(rate=1, burst=1)
+    assert store.take_many([("key", key_limit), ("noisy", device_limit)]) == [0, 0]
+    for _ in range(5):
+        waits = store.take_many([("key", key_limit), ("noisy", device_limit)])
+        assert waits[0] == 0 and waits[1] > 0
+    # The key still has the two tokens the rejected requests didn't spend
+    assert store.take_many([("key", key_limit), ("quiet-1", device_limit)]) == [0, 0]
+    assert store.take_many([("key", key_limit), ("quiet-2", device_limit)]) == [0, 0]
+
+
+def test_redis_store_falls_back_to_memory_on_error():
+    class FakeRedisError(Exception):
+        pass
+
+    def failing_script(keys, args):
+        raise FakeRedisError("connection refused")
+
+    store = RedisBucketStore(failing_script, (FakeRedisError,))
+    limit = BucketConfig(rate=1, burst=1)
+    assert store.take("key", limit) == 0
+    assert store.take("key", limit) > 0
+
+
+def test_redis_store_backs_off_while_degraded():
+    class FakeRedisError(Exception):
+        pass
+
+    calls = []
+    healthy = False
+
+    def script(keys, args):
+        calls.append(keys)
+        if not healthy:
+            raise FakeRedisError("timeout")
+        return [b"0"] * len(keys)
+
+    clock = FakeClock()
+    store = RedisBucketStore(script, (FakeRedisError,), retry_after=5, clock=clock)
+    limit = BucketConfig(rate=1, burst=100)
+    store.take("key", limit)
+    for _ in range(10):
+        store.take("key", limit)
+    # Only the first call hit Redis; the rest went straight to the fallback
+    assert len(calls) == 1
+    healthy = True
+    clock.now += 6
+    assert store.take_many([("key", limit), ("device", limit)]) == [0, 0]
+    assert len(calls) == 2
+
+
+def test_bucket_config_rejects_invalid_env(monkeypatch):
+    monkeypatch.setenv("TEST_LIMIT_RATE", "0")
+    with pytest.raises(ValueError, match="TEST_LIMIT_RATE"):
+        rate_limit._bucket_from_env("TEST_LIMIT", "1", "1")
+    monkeypatch.setenv("TEST_LIMIT_RATE", "1")
+    monkeypatch.setenv("TEST_LIMIT_BURST", "0")
+    with pytest.raises(ValueError, match="TEST_LIMIT_BURST"):
+        rate_limit._bucket_from_env("TEST_LIMIT", "1", "1")
+
+
+def test_pool_wait_tracker_needs_min_samples():
+    tracker = PoolWaitTracker(min_samples=3, clock=FakeClock())
+    tracker.record(1000)
+    tracker.record(1000)
+    assert tracker.average_ms == 0
+    tracker.record(1000)
+    assert tracker.average_ms == pytest.approx(1000)
+
+
+def test_pool_wait_tracker_goes_stale():
+    clock = FakeClock()
+    tracker = PoolWaitTracker(alpha=0.5, stale_after=5, min_samples=1, clock=clock)
+    tracker.record(100)
+    tracker.record(200)
+    assert tracker.average_ms == pytest.approx(150)
+    clock.now += 6
+    assert tracker.average_ms == 0
+
+
+def test_single_slow_sample_after_stale_does_not_shed():
+    clock = FakeClock()
+    tracker = PoolWaitTracker(stale_after=5, min_samples=2, clock=clock)
+    tracker.record(10)
+    tracker.record(10)
+    clock.now += 6
+    tracker.record(5000)
+    assert tracker.average_ms == 0
+
+
+def test_rate_limit_returns_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(rate_limit, "bucket_store", MemoryBucketStore(clock=FakeClock()))
+    limit = BucketConfig(rate=0.5, burst=1)
+    rate_limit._enforce("key", "sensor-1", "read", limit, limit)
+    with pytest.raises(HTTPException) as exc:
+        rate_limit._enforce("key", "sensor-1", "read", limit, limit)
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "2"
+
+
+def test_reads_are_shed_before_ingest(monkeypatch):
+    tracker = PoolWaitTracker(min_samples=1, clock=FakeClock())
+    tracker.record(500)
+    monkeypatch.setattr(rate_limit, "pool_wait_tracker", tracker)
+    with pytest.raises(HTTPException) as exc:
+        rate_limit._shed_if_overloaded(rate_limit.SHED_READ_WAIT_MS)
+    assert exc.value.status_code == 503
+    rate_limit._shed_if_overloaded(rate_limit.SHED_INGEST_WAIT_MS)